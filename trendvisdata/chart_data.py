@@ -1,4 +1,3 @@
-import copy
 import datetime as dt
 from math import log10, floor
 import numpy as np
@@ -28,12 +27,11 @@ class Data():
         Returns
         -------
         params : dict
-            Deep copy of the default parameter dict with all keys in
-            inputs applied.
+            Shallow copy of the default parameter dict with all keys in
+            inputs applied. Nested default values are shared with
+            trend_params_dict and are replaced rather than mutated.
         """
-        params: dict = copy.deepcopy(trend_params_dict['df_params'])
-        for key, value in inputs.items():
-            params[key] = value
+        params: dict = {**trend_params_dict['df_params'], **inputs}
         return params
 
     @classmethod
@@ -367,11 +365,7 @@ class Data():
             markets
 
         """
-        if params['chart_mkts'] is not None:
-            params = Formatting.create_mkt_dims(params)
-        
-        params['num_charts'] = int(
-            params['chart_dimensions'][0] * params['chart_dimensions'][1])
+        params = cls.set_market_chart_params(params)
         
         data_list = Formatting.create_data_list(
             params=params, barometer=tables['barometer'], market_chart=True,
@@ -407,6 +401,36 @@ class Data():
         return market_dict
     
 
+    @staticmethod
+    def set_market_chart_params(params: dict) -> dict:
+        """
+        Set the market chart dimensions and number of charts.
+
+        Parameters
+        ----------
+        params : Dict
+            chart_mkts : Int (Optional)
+                Number of markets to chart. The default is None.
+            chart_dimensions : Tuple
+                Width and height to determine the number of markets to chart. The 
+                default is (8, 5)
+
+        Returns
+        -------
+        params : Dict
+            Dictionary of key parameters with chart_dimensions and num_charts
+            set.
+
+        """
+        if params['chart_mkts'] is not None:
+            params = Formatting.create_mkt_dims(params)
+        
+        params['num_charts'] = int(
+            params['chart_dimensions'][0] * params['chart_dimensions'][1])
+
+        return params
+    
+
     @classmethod
     def _round_floats(cls, obj):
         if isinstance(obj, float): return round(obj, 2)
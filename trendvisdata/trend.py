@@ -2,17 +2,18 @@
 Calculate Trend Strength across various markets / asset classes and graph
 results.
 """
-import copy
+from concurrent.futures import ThreadPoolExecutor
 import norgatedata
+import numpy as np
 import pandas as pd
 import datetime as dt
+from functools import cached_property, lru_cache
 from pandas.tseries.offsets import BDay, DateOffset
 from trendvisdata.chart_data import Data
 from trendvisdata.sector_mappings import sectmap
 from trendvisdata.trend_params import trend_params_dict
 from trendvisdata.trend_data import Fields, TrendRank
 from trendvisdata.market_data import NorgateExtract, YahooExtract, MktUtils
-from typing import cast
 
 
 class TrendStrength():
@@ -87,28 +88,27 @@ class TrendStrength():
     """
     def __init__(self, **kwargs) -> None:
 
-        # Import dictionary of default parameters
-        self.default_dict = copy.deepcopy(trend_params_dict)
+        # Import dictionary of default parameters, copying one level deep as
+        # the nested values are only read
+        self.default_dict = {
+            key: dict(value) if isinstance(value, dict) else value
+            for key, value in trend_params_dict.items()}
 
-        # Import dictionary of sector mappings
-        mappings = copy.deepcopy(sectmap)
+        # Import dictionary of sector mappings; only top level keys are
+        # assigned so a shallow copy suffices
+        mappings = dict(sectmap)
 
-        # Store initial inputs
-        inputs = {}
-        for key, value in kwargs.items():
-            inputs[key] = value
+        # Initialise system parameters from the initial inputs
+        params = Data._init_params(kwargs)
 
-        # Initialise system parameters
-        params = Data._init_params(inputs)
+        # Import the data from Norgate Data or Yahoo Finance
+        if params['source'] not in self._SOURCE_PREP:
+            raise ValueError(
+                f"Unknown source '{params['source']}'; choose from "
+                f"{', '.join(self._SOURCE_PREP)}")
 
-        # Import the data from Norgate Data
-        if params['source'] == 'norgate':
-            params, tables, mappings = self.prep_norgate(
-                 params=params, mappings=mappings)
-
-        # Or from Yahoo Finance
-        elif params['source'] == 'yahoo':
-            params, tables, mappings = self.prep_yahoo(
+        params, tables, mappings = getattr(
+            self, self._SOURCE_PREP[params['source']])(
                 params=params, mappings=mappings)
 
         # Calculate the technical indicator fields and Trend Strength table
@@ -119,14 +119,31 @@ class TrendStrength():
         top_trends, tables = self.top_trend_tickers(
             params=params, tables=tables)
 
-        # Generate data dictionary for graphing via API
-        data_dict = Data.get_all_data(params=params, tables=tables)
+        # Set the market chart parameters now so that params is complete
+        # without needing to generate data_dict
+        params = Data.set_market_chart_params(params)
 
         self.top_trends = top_trends
         self.tables = tables
         self.params = params
         self.mappings = mappings
-        self.data_dict = data_dict
+
+
+    @cached_property
+    def data_dict(self) -> dict:
+        """
+        Generate data dictionary for graphing via API. This is calculated on
+        first access and then cached. The chart parameters it relies on are
+        already set in self.params by __init__, so accessing it does not
+        change them.
+
+        Returns
+        -------
+        data_dict : Dict
+            Dictionary of chart data.
+
+        """
+        return Data.get_all_data(params=self.params, tables=self.tables)
 
 
     @staticmethod
@@ -229,6 +246,14 @@ class TrendStrength():
         return params, tables, mappings
 
 
+    # Map each data source to the name of the method that prepares its price
+    # data, looked up on the instance so subclasses can override it
+    _SOURCE_PREP = {
+        'norgate': 'prep_norgate',
+        'yahoo': 'prep_yahoo',
+        }
+
+
     @staticmethod
     def trend_calc(
         params: dict,
@@ -293,21 +318,48 @@ class TrendStrength():
         return top_trends, tables
 
 
+def _tenor_returns(prices: np.ndarray, tenor_rows: np.ndarray) -> np.ndarray:
+    """
+    Calculate the percentage return from each tenor row to the last row for
+    every column of a price array.
+
+    Parameters
+    ----------
+    prices : ndarray
+        Contiguous float array of prices, one row per date and one column
+        per ticker.
+    tenor_rows : ndarray
+        Integer row positions of the tenor dates.
+
+    Returns
+    -------
+    returns : ndarray
+        Array of percentage returns, one row per tenor and one column per
+        ticker.
+
+    """
+    current_prices = prices[-1, :]
+    past_prices = prices[tenor_rows, :]
+
+    return (current_prices - past_prices) / past_prices * 100
+
+
 class ReturnsHistory():
     """
     Generate dictionary of lists of various return periods.
     """
-    def __init__(self, start_date, end_date) -> None:
+    def __init__(self, start_date, end_date, dtype=np.float64) -> None:
         self.tenor_mappings = trend_params_dict['df_params']['tenor_mappings']
         self.returns = self.generate_returns(
             start_date,
             end_date,
-            self.tenor_mappings
+            self.tenor_mappings,
+            dtype=dtype
             )
 
 
-    @staticmethod
-    def get_tickers() -> list:
+    @classmethod
+    def get_tickers(cls) -> list:
         """
         Get all the tickers from the Norgate Futures package (other than individual
         contracts)
@@ -317,6 +369,25 @@ class ReturnsHistory():
         lim_tickers : List
             List of ticker codes.
 
+        """
+        lim_tickers = list(cls._norgate_tickers())
+
+        return lim_tickers
+
+
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def _norgate_tickers() -> tuple:
+        """
+        Query the Norgate databases for all tickers (other than individual
+        contracts). The result is cached for the session as the database
+        contents do not change between ReturnsHistory instances.
+
+        Returns
+        -------
+        lim_tickers : Tuple
+            Tuple of ticker codes.
+
         """
         all_tickers = []
         alldatabasenames = norgatedata.databases()
@@ -325,22 +396,43 @@ class ReturnsHistory():
 
         for item in databasenames:
             tickers = norgatedata.database_symbols(item)
-            for ticker in tickers: # type: ignore
-                all_tickers.append(ticker)
+            all_tickers.extend(tickers) # type: ignore
 
-        lim_tickers = []
-        for ticker in all_tickers:
-            if ticker[-4:] != '_CCB':
-                lim_tickers.append(ticker)
+        # Exclude the back-adjusted continuous contracts
+        lim_tickers = tuple(
+            ticker for ticker in all_tickers if not ticker.endswith('_CCB'))
 
         return lim_tickers
 
 
     @staticmethod
+    @lru_cache(maxsize=4096)
+    def _security_name(ticker: str) -> str:
+        """
+        Return the Norgate security name for a ticker, cached for the session.
+
+        Parameters
+        ----------
+        ticker : String
+            Ticker code.
+
+        Returns
+        -------
+        ticker_name : String
+            Security name.
+
+        """
+        return norgatedata.security_name(ticker) # type: ignore
+
+
+    @classmethod
     def get_history(
+            cls,
             start_date: str,
             end_date: str,
-            tickers: list) -> pd.DataFrame:
+            tickers: list,
+            max_workers: int = 16,
+            dtype: type = np.float64) -> pd.DataFrame:
         """
         Create DataFrame of closing price histories for provided list of tickers
 
@@ -352,6 +444,13 @@ class ReturnsHistory():
             The end date for comparison. The format is YYYY-MM-DD
         tickers : List
             List of ticker codes.
+        max_workers : Int, optional
+            Maximum number of threads used to download price histories. The
+            default is 16.
+        dtype : Type, optional
+            Float type used to store the prices. np.float32 halves the memory
+            used by the history and the returns calculations at the cost of
+            precision. The default is np.float64.
 
         Returns
         -------
@@ -360,8 +459,6 @@ class ReturnsHistory():
             tickers.
 
         """
-        history = pd.DataFrame()
-
         # If end date is not supplied, set to previous working day
         if end_date is None:
             end_date_as_dt = (dt.datetime.today() - BDay(1)).date()
@@ -374,25 +471,79 @@ class ReturnsHistory():
                 - pd.Timedelta(days=trend_params_dict['df_params']['lookback']*(365/250))).date()
             start_date = str(start_date_as_dt)
 
-        for ticker in tickers:
-            data = norgatedata.price_timeseries(
-                ticker, start_date=start_date,
-                end_date=end_date,
-                format='pandas-dataframe',)
+        # Download each closing price history concurrently as the Norgate
+        # calls are I/O bound
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            close_dict = dict(executor.map(
+                lambda ticker: cls._get_close(ticker, start_date, end_date),
+                tickers
+                ))
+
+        # Construct the DataFrame once from the dictionary of closing prices,
+        # aligning each series on the date index
+        history = pd.DataFrame(close_dict)
+
+        # Forward fill each column in NumPy by carrying forward the row
+        # number of the last valid price
+        prices = history.to_numpy(dtype=dtype)
+        rows = np.arange(len(prices))[:, None]
+        last_valid = np.where(np.isnan(prices), 0, rows)
+        np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+        prices = prices[last_valid, np.arange(prices.shape[1])]
+
+        # Drop the leading rows before every ticker has a price
+        complete_rows = ~np.isnan(prices).any(axis=1)
+
+        history = pd.DataFrame(
+            prices[complete_rows],
+            index=history.index[complete_rows],
+            columns=history.columns
+            )
 
-            ticker_name = norgatedata.security_name(ticker)
+        return history
 
-            if len(history) == 0:
-                history[ticker_name] = data['Close'] # type: ignore
-            else:
-                data.rename(columns={'Close': ticker_name}, inplace=True) # type: ignore
-                history = pd.concat((history, data[ticker_name]), axis=1) # type: ignore
 
-        history.ffill(inplace=True)
+    @classmethod
+    def _get_close(
+            cls,
+            ticker: str,
+            start_date: str,
+            end_date: str) -> tuple[str, pd.Series]:
+        """
+        Extract the closing price history for a single ticker, together with
+        the security name.
 
-        history.dropna(inplace=True)
+        Parameters
+        ----------
+        ticker : String
+            Ticker code.
+        start_date : String
+            The start date for comparison. The format is YYYY-MM-DD
+        end_date : String
+            The end date for comparison. The format is YYYY-MM-DD
 
-        return history
+        Returns
+        -------
+        ticker_name : String
+            Security name.
+        close : Series
+            Pandas Series of closing prices.
+
+        """
+        # Extract as a record array to avoid building a full DataFrame when
+        # only the closing prices are needed
+        data = norgatedata.price_timeseries(
+            ticker, start_date=start_date,
+            end_date=end_date,
+            format='numpy-recarray',)
+
+        close = pd.Series(
+            data['Close'], # type: ignore
+            index=pd.DatetimeIndex(data['Date'], name='Date')) # type: ignore
+
+        ticker_name = cls._security_name(ticker)
+
+        return ticker_name, close
 
     
     @classmethod
@@ -400,7 +551,9 @@ class ReturnsHistory():
         cls, 
         history: pd.DataFrame, 
         tenor_mappings: dict, 
-        short_label: bool = True) -> dict:
+        short_label: bool = True,
+        flat: bool = False,
+        tenor_rows: dict | None = None) -> dict:
         """
         Calculate prices for each ticker and store these in a dictionary of lists
 
@@ -412,6 +565,12 @@ class ReturnsHistory():
         tenor_mappings : Dict
             Dictionary of mappings from week / month to day and day to column
             headings.
+        flat : Bool, optional
+            Whether to return the data as a single 2D list of values rather
+            than a list of dictionaries, one per asset. The default is False.
+        tenor_rows : Dict, optional
+            Dictionary mapping tenor days to rows of history, as returned by
+            _get_tenor_rows. Calculated from history if not supplied.
 
         Returns
         -------
@@ -419,28 +578,22 @@ class ReturnsHistory():
             Dictionary of lists of various return periods.
 
         """
-        tenor_dates = cls._get_tenor_dates(history, tenor_mappings, short_label)
-        
-        prices_df = pd.DataFrame()
-        prices_df.index = history.columns
-        
-        for column in history.columns:
-            for tenor_label, date_val in tenor_dates.items():
-                prices_df.loc[column, tenor_label] = history.loc[date_val, column]
-        
-        data = prices_df.T.to_dict(orient='list')
-        tenors = list(prices_df.columns)
-        prices_array = []
-        for key, value in data.items():
-            asset_dict = {'label': key}
-            for num, tenor in enumerate(tenors):
-                asset_dict[tenor] = value[num]
-            prices_array.append(asset_dict)
+        # Row positions of each tenor date, shared by every ticker
+        if tenor_rows is None:
+            tenor_rows = cls._get_tenor_rows(
+                history=history, tenor_mappings=tenor_mappings)
+
+        # Select the prices at every tenor date for all tickers at once
+        prices = cls._price_array(history)
+        rows = np.fromiter(tenor_rows.values(), dtype=np.intp)
+
+        prices_df = pd.DataFrame(
+            prices[rows, :].T,
+            index=history.columns,
+            columns=cls._tenor_labels(tenor_rows, tenor_mappings, short_label)
+            )
         
-        return {
-            'data': prices_array,
-            'labels': tenors
-        }
+        return cls._format_tenor_data(tenor_df=prices_df, flat=flat)
     
 
     @classmethod
@@ -448,7 +601,9 @@ class ReturnsHistory():
         cls, 
         history: pd.DataFrame, 
         tenor_mappings: dict, 
-        short_label: bool = True) -> dict:
+        short_label: bool = True,
+        flat: bool = False,
+        tenor_rows: dict | None = None) -> dict:
         """
         Calculate returns for each ticker and store these in a dictionary of lists
 
@@ -460,6 +615,12 @@ class ReturnsHistory():
         tenor_mappings : Dict
             Dictionary of mappings from week / month to day and day to column
             headings.
+        flat : Bool, optional
+            Whether to return the data as a single 2D list of values rather
+            than a list of dictionaries, one per asset. The default is False.
+        tenor_rows : Dict, optional
+            Dictionary mapping tenor days to rows of history, as returned by
+            _get_tenor_rows. Calculated from history if not supplied.
 
         Returns
         -------
@@ -467,99 +628,172 @@ class ReturnsHistory():
             Dictionary of lists of various return periods.
 
         """
-        tenor_dates = cls._get_tenor_dates(
-            history=history, 
-            tenor_mappings=tenor_mappings, 
-            short_label=short_label
+        # Row positions of each tenor date, shared by every ticker
+        if tenor_rows is None:
+            tenor_rows = cls._get_tenor_rows(
+                history=history, tenor_mappings=tenor_mappings)
+
+        # Calculate all tenor returns for all tickers in one array operation.
+        # For the day tenors this matches history.pct_change(periods=day) on
+        # the last row, but only reads the tenor rows rather than computing
+        # changes over the whole history for every period
+        prices = cls._price_array(history)
+        rows = np.fromiter(tenor_rows.values(), dtype=np.intp)
+        returns = _tenor_returns(prices, rows)
+
+        returns_df = pd.DataFrame(
+            returns.T,
+            index=history.columns,
+            columns=cls._tenor_labels(tenor_rows, tenor_mappings, short_label)
             )
-        
-        returns_df = pd.DataFrame()
-        returns_df.index = history.columns
-        end_date = history.index[-1]
-        
-        for column in history.columns:
-            current_price = cast(float, history.loc[end_date, column])
-            
-            for tenor_label, date_val in tenor_dates.items():
-                past_price = cast(float, history.loc[date_val, column])
-                returns_df.loc[column, tenor_label] = (
-                    (current_price - past_price) / past_price * 100
-                )
-        
-        data = returns_df.T.to_dict(orient='list')
-        tenors = list(returns_df.columns)
-        returns_array = []
-        for key, value in data.items():
-            asset_dict = {'label': key}
-            for num, tenor in enumerate(tenors):
-                asset_dict[tenor] = value[num]
-            returns_array.append(asset_dict)
-        
+
+        return cls._format_tenor_data(tenor_df=returns_df, flat=flat)
+
+
+    @staticmethod
+    def _format_tenor_data(tenor_df: pd.DataFrame, flat: bool) -> dict:
+        """
+        Convert a DataFrame of values by asset and tenor into the output
+        dictionary.
+
+        Parameters
+        ----------
+        tenor_df : DataFrame
+            Pandas DataFrame of values with one row per asset and one column
+            per tenor.
+        flat : Bool
+            Whether to return the data as a single 2D list of values rather
+            than a list of dictionaries, one per asset.
+
+        Returns
+        -------
+        tenor_dict : Dict
+            Dictionary of the data and tenor labels.
+
+        """
+        tenors = list(tenor_df.columns)
+
+        # Columnar layout: asset labels plus one row of values per asset
+        if flat:
+            data = {
+                'labels': list(tenor_df.index),
+                'values': tenor_df.to_numpy().tolist(),
+                'tenors': tenors
+            }
+
+        # Build one dictionary per asset directly from the rows
+        else:
+            data = [
+                {'label': row[0], **dict(zip(tenors, row[1:]))}
+                for row in tenor_df.itertuples(index=True, name=None)
+                ]
+
         return {
-            'data': returns_array,
+            'data': data,
             'labels': tenors
         }
 
 
     @staticmethod
-    def _get_tenor_dates(
+    def _get_tenor_rows(
         history: pd.DataFrame, 
-        tenor_mappings: dict, 
-        short_label: bool) -> dict:
+        tenor_mappings: dict) -> dict:
         """
-        Calculate the actual dates to use for each tenor period.
+        Calculate the rows of the price history to use for each tenor period.
         
         Returns
         -------
-        tenor_dates : dict
-            Dictionary mapping tenor labels to actual dates
-        """
-        def find_nearest_business_day(target_date, available_dates):
-            """Find the nearest available business day to the target date."""
-            if target_date in available_dates:
-                return target_date
-            
-            available_dates_sorted = sorted(available_dates)
-            
-            # Find dates on or after target
-            future_dates = [d for d in available_dates_sorted if d >= target_date]
-            if future_dates:
-                return future_dates[0]
-            
-            # If target is before our data starts, take the earliest available
-            return available_dates_sorted[0]
-        
+        tenor_rows : dict
+            Dictionary mapping tenor days to row positions in history
+
+        Raises
+        ------
+        IndexError
+            If history has too few rows for the longest day tenor.
+        """
         end_date = history.index[-1]
-        available_dates = set(history.index)
         
         days = tenor_mappings['days']
         weeks = tenor_mappings['weeks']
         months = tenor_mappings['months']
-        if short_label:
-            labels = tenor_mappings['short_labels']
-        else:                
-            labels = tenor_mappings['labels']
         
-        tenor_dates = {}
+        # Negative row positions would silently wrap around to the end of
+        # the history, so require a row for every day tenor
+        if len(history) <= max(days):
+            raise IndexError(
+                f"Price history has {len(history)} rows; at least "
+                f"{max(days) + 1} are needed for the day tenors")
+        
+        tenor_rows = {}
         
-        # Days: convert trading day offset to actual date
+        # Days: convert trading day offset to row position
         for day in days:
-            actual_date = history.index[-day-1]
-            tenor_dates[labels[day]] = actual_date
+            tenor_rows[day] = len(history) - day - 1
+        
+        # Weeks and months: use calendar arithmetic with business day 
+        # adjustment, calculating each target date once
+        week_start_dates = {
+            week_day: end_date + DateOffset(weeks=-week)
+            for week, week_day in weeks.items()}
+        month_start_dates = {
+            month_day: end_date + DateOffset(months=-month)
+            for month, month_day in months.items()}
+        target_dates = {**week_start_dates, **month_start_dates}
+        
+        # Find the first available date on or after each target date in a 
+        # single lookup; if there is none, take the earliest available
+        target_rows = history.index.get_indexer(
+            list(target_dates.values()), method='bfill')
+        target_rows = np.where(target_rows < 0, 0, target_rows)
+        
+        for calendar_day, row in zip(target_dates, target_rows):
+            tenor_rows[calendar_day] = int(row)
         
-        # Weeks: use calendar arithmetic with business day adjustment
-        for week, week_day in weeks.items():
-            target_date = end_date + DateOffset(weeks=-week)
-            actual_date = find_nearest_business_day(target_date, available_dates)
-            tenor_dates[labels[week_day]] = actual_date
+        return tenor_rows
+
+
+    @staticmethod
+    def _tenor_labels(
+        tenor_rows: dict, 
+        tenor_mappings: dict, 
+        short_label: bool) -> list:
+        """
+        Return the column headings for each tenor period.
         
-        # Months: use calendar arithmetic with business day adjustment
-        for month, month_day in months.items():
-            target_date = end_date + DateOffset(months=-month)
-            actual_date = find_nearest_business_day(target_date, available_dates)
-            tenor_dates[labels[month_day]] = actual_date
+        Returns
+        -------
+        tenor_labels : list
+            List of tenor labels in the same order as tenor_rows
+        """
+        if short_label:
+            labels = tenor_mappings['short_labels']
+        else:                
+            labels = tenor_mappings['labels']
         
-        return tenor_dates
+        return [labels[tenor_day] for tenor_day in tenor_rows]
+
+
+    @staticmethod
+    def _price_array(history: pd.DataFrame) -> np.ndarray:
+        """
+        Return the price history as a contiguous float array, keeping float32
+        prices as float32 and widening anything else to float64.
+
+        Parameters
+        ----------
+        history : DataFrame
+            Pandas DataFrame of history of closing prices for each ticker in
+            tickers.
+
+        Returns
+        -------
+        prices : ndarray
+            Array of prices, one row per date and one column per ticker.
+
+        """
+        dtype = np.result_type(np.float32, *history.dtypes)
+
+        return np.ascontiguousarray(history.to_numpy(dtype=dtype))
 
 
     @classmethod
@@ -567,7 +801,8 @@ class ReturnsHistory():
             cls,
             start_date: str,
             end_date: str,
-            tenor_mappings: dict) -> dict:
+            tenor_mappings: dict,
+            dtype: type = np.float64) -> dict:
         """
         Generate dictionary of lists of various return periods.
 
@@ -580,6 +815,9 @@ class ReturnsHistory():
         tenor_mappings : Dict
             Dictionary of mappings from week / month to day and day to column
             headings.
+        dtype : Type, optional
+            Float type used to store the price history. The default is
+            np.float64.
 
         Returns
         -------
@@ -588,26 +826,35 @@ class ReturnsHistory():
 
         """
         tickers = cls.get_tickers()
-        history = cls.get_history(start_date, end_date, tickers)
+        history = cls.get_history(start_date, end_date, tickers, dtype=dtype)
+
+        # Calculate the tenor rows once and share them across each output
+        tenor_rows = cls._get_tenor_rows(
+            history=history, tenor_mappings=tenor_mappings)
+
         returns = cls.get_returns(
             history=history, 
             tenor_mappings=tenor_mappings, 
-            short_label=True
+            short_label=True,
+            tenor_rows=tenor_rows
             )
         returns_long = cls.get_returns(
             history=history, 
             tenor_mappings=tenor_mappings, 
-            short_label=False
+            short_label=False,
+            tenor_rows=tenor_rows
             )
         prices = cls.get_prices(
             history=history, 
             tenor_mappings=tenor_mappings, 
-            short_label=True
+            short_label=True,
+            tenor_rows=tenor_rows
             )
         prices_long = cls.get_prices(
             history=history, 
             tenor_mappings=tenor_mappings, 
-            short_label=False
+            short_label=False,
+            tenor_rows=tenor_rows
             )
 
         return {
@@ -462,6 +462,10 @@ class Fields():
         # tickers as rows
         frame = pd.DataFrame(columns=params['trend_flags'], index=ticker_list)
 
+        # Preallocate the largest change column so it is filled in place
+        # rather than enlarging the frame when the first value is set
+        frame['largest_change'] = np.nan
+
         # Merge the two DataFrames
         frame = pd.merge(frame, ticker_name_df, left_index=True,
                          right_index=True)